@@ -22,19 +22,28 @@ interface QueueState {
 
 // ===== Persistent Python Worker =====
 // The Python process loads the model once (~90s) and stays alive.
-// Node.js sends metadata paths via stdin; Python sends DONE via stdout.
+// Both directions use length-prefixed JSON messages (4-byte big-endian
+// length + UTF-8 JSON payload); see scripts/process_scene_queue.py.
 interface PythonWorker {
   process: ChildProcess;
   ready: Promise<void>;
   alive: boolean;
   currentResolve: ((data?: any) => void) | null;
   currentReject: ((err: Error) => void) | null;
-  stdoutBuffer: string;
+  stdoutBuffer: Buffer;
+}
+
+// Live description progress reported by the worker, keyed by metadata path.
+// Fresher than metadata.json, which the worker only flushes periodically.
+interface LiveProgress {
+  processingIndex: number;
+  progress: number;
 }
 
 const g = globalThis as unknown as {
   __shotlisterQueue?: QueueState;
   __shotlisterPython?: PythonWorker | null;
+  __shotlisterProgress?: Map<string, LiveProgress>;
 };
 if (!g.__shotlisterQueue) {
   g.__shotlisterQueue = { queue: [], processing: null };
@@ -42,6 +51,9 @@ if (!g.__shotlisterQueue) {
 if (g.__shotlisterPython === undefined) {
   g.__shotlisterPython = null;
 }
+if (!g.__shotlisterProgress) {
+  g.__shotlisterProgress = new Map();
+}
 
 // ===== Config =====
 
@@ -68,7 +80,7 @@ function getOrCreatePythonWorker(): Promise<PythonWorker> {
   console.log('[Python Worker] Starting persistent Python process...');
 
   const proc = spawn(pythonCmd, [scriptPath, '--persistent'], {
-    stdio: ['pipe', 'pipe', 'inherit'] // stdin: pipe (send paths), stdout: pipe (READY/DONE), stderr: inherit (logging)
+    stdio: ['pipe', 'pipe', 'inherit'] // stdin: pipe (commands), stdout: pipe (events), stderr: inherit (logging)
   });
 
   let readyResolve: () => void;
@@ -80,7 +92,7 @@ function getOrCreatePythonWorker(): Promise<PythonWorker> {
     alive: true,
     currentResolve: null,
     currentReject: null,
-    stdoutBuffer: '',
+    stdoutBuffer: Buffer.alloc(0),
   };
 
   worker.ready = new Promise<void>((resolve, reject) => {
@@ -88,42 +100,56 @@ function getOrCreatePythonWorker(): Promise<PythonWorker> {
     readyReject = reject;
   });
 
+  const resolveCurrent = (data?: any) => {
+    if (worker.currentResolve) {
+      const cb = worker.currentResolve;
+      worker.currentResolve = null;
+      worker.currentReject = null;
+      cb(data);
+    }
+  };
+
+  const rejectCurrent = (err: Error) => {
+    if (worker.currentReject) {
+      const cb = worker.currentReject;
+      worker.currentResolve = null;
+      worker.currentReject = null;
+      cb(err);
+    }
+  };
+
   proc.stdout!.on('data', (chunk: Buffer) => {
-    worker.stdoutBuffer += chunk.toString();
-    const lines = worker.stdoutBuffer.split('\n');
-    worker.stdoutBuffer = lines.pop()!; // keep incomplete line in buffer
+    worker.stdoutBuffer = Buffer.concat([worker.stdoutBuffer, chunk]);
+
+    // Consume every complete frame; keep any partial frame in the buffer
+    while (worker.stdoutBuffer.length >= 4) {
+      const length = worker.stdoutBuffer.readUInt32BE(0);
+      if (worker.stdoutBuffer.length < 4 + length) break;
+      const payload = worker.stdoutBuffer.subarray(4, 4 + length).toString('utf-8');
+      worker.stdoutBuffer = worker.stdoutBuffer.subarray(4 + length);
+
+      let message: any;
+      try {
+        message = JSON.parse(payload);
+      } catch (e) {
+        console.error('[Python Worker] Failed to parse message:', e);
+        rejectCurrent(new Error('Failed to parse Python worker message'));
+        continue;
+      }
 
-    for (const line of lines) {
-      const trimmed = line.trim();
-      if (trimmed === 'READY') {
+      if (message.event === 'READY') {
         console.log('[Python Worker] Model loaded and ready');
         readyResolve();
-      } else if (trimmed.startsWith('DETECT_DONE|')) {
-        const json = trimmed.substring('DETECT_DONE|'.length);
-        try {
-          const scenes = JSON.parse(json);
-          if (worker.currentResolve) {
-            const cb = worker.currentResolve;
-            worker.currentResolve = null;
-            worker.currentReject = null;
-            cb(scenes);
-          }
-        } catch (e) {
-          console.error('[Python Worker] Failed to parse DETECT_DONE JSON:', e);
-          if (worker.currentReject) {
-            const cb = worker.currentReject;
-            worker.currentResolve = null;
-            worker.currentReject = null;
-            cb(new Error('Failed to parse scene detection results'));
-          }
-        }
-      } else if (trimmed.startsWith('DONE:')) {
-        if (worker.currentResolve) {
-          const cb = worker.currentResolve;
-          worker.currentResolve = null;
-          worker.currentReject = null;
-          cb();
-        }
+      } else if (message.event === 'DETECT_DONE') {
+        resolveCurrent(message.scenes);
+      } else if (message.event === 'PROGRESS') {
+        g.__shotlisterProgress!.set(message.metadata_path, {
+          processingIndex: message.processingIndex,
+          progress: message.progress,
+        });
+      } else if (message.event === 'DONE') {
+        g.__shotlisterProgress!.delete(message.metadata_path);
+        resolveCurrent();
       }
     }
   });
@@ -131,13 +157,9 @@ function getOrCreatePythonWorker(): Promise<PythonWorker> {
   proc.on('exit', (code) => {
     console.log(`[Python Worker] Process exited with code ${code}`);
     worker.alive = false;
+    g.__shotlisterProgress!.clear();
     // Reject pending work
-    if (worker.currentReject) {
-      const cb = worker.currentReject;
-      worker.currentResolve = null;
-      worker.currentReject = null;
-      cb(new Error(`Python process exited with code ${code}`));
-    }
+    rejectCurrent(new Error(`Python process exited with code ${code}`));
     // If model never loaded, reject the ready promise (no-op if already resolved)
     readyReject(new Error(`Python process exited with code ${code} before model loaded`));
     g.__shotlisterPython = null;
@@ -146,12 +168,7 @@ function getOrCreatePythonWorker(): Promise<PythonWorker> {
   proc.on('error', (err) => {
     console.error('[Python Worker] Process error:', err);
     worker.alive = false;
-    if (worker.currentReject) {
-      const cb = worker.currentReject;
-      worker.currentResolve = null;
-      worker.currentReject = null;
-      cb(err);
-    }
+    rejectCurrent(err);
     readyReject(err);
     g.__shotlisterPython = null;
   });
@@ -161,13 +178,20 @@ function getOrCreatePythonWorker(): Promise<PythonWorker> {
   return worker.ready.then(() => worker);
 }
 
+function sendToWorker(worker: PythonWorker, message: Record<string, unknown>) {
+  const payload = Buffer.from(JSON.stringify(message), 'utf-8');
+  const header = Buffer.alloc(4);
+  header.writeUInt32BE(payload.length, 0);
+  worker.process.stdin!.write(Buffer.concat([header, payload]));
+}
+
 async function processSceneDescriptions(metadataPath: string): Promise<void> {
   const worker = await getOrCreatePythonWorker();
 
   return new Promise<void>((resolve, reject) => {
     worker.currentResolve = resolve;
     worker.currentReject = reject;
-    worker.process.stdin!.write(metadataPath + '\n');
+    sendToWorker(worker, { cmd: 'DESCRIBE', metadata_path: metadataPath });
   });
 }
 
@@ -177,7 +201,7 @@ async function detectScenesWithWorker(videoPath: string, uploadId: string, outpu
   return new Promise<any[]>((resolve, reject) => {
     worker.currentResolve = (data?: any) => resolve(data || []);
     worker.currentReject = reject;
-    worker.process.stdin!.write(`DETECT|${videoPath}|${uploadId}|${outputDir}\n`);
+    sendToWorker(worker, { cmd: 'DETECT', video: videoPath, upload_id: uploadId, output_dir: outputDir });
   });
 }
 
@@ -423,14 +447,15 @@ export async function GET(req: NextRequest) {
     try {
       const data = await fs.readFile(scenesMetadataPath, 'utf-8');
       const metadata = JSON.parse(data);
+      const live = metadata.descriptionsComplete ? undefined : g.__shotlisterProgress!.get(scenesMetadataPath);
 
-      // Return all metadata including progress info
+      // Return all metadata including progress info (live worker progress wins)
       return NextResponse.json({
         uploadId: metadata.uploadId,
         scenes: metadata.scenes || [],
         descriptionsComplete: metadata.descriptionsComplete ?? true,
-        progress: metadata.progress ?? 100,
-        processingIndex: metadata.processingIndex ?? -1,
+        progress: live?.progress ?? metadata.progress ?? 100,
+        processingIndex: live?.processingIndex ?? metadata.processingIndex ?? -1,
         excelGenerated: metadata.excelGenerated ?? false,
         queued: metadata.queued ?? false,
         videoTitle: metadata.videoTitle ?? '',
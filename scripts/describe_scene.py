@@ -20,24 +20,49 @@ except ImportError:
 MODEL_ID = "HuggingFaceTB/SmolVLM2-500M-Video-Instruct"
 device = "cuda" if torch.cuda.is_available() else "cpu"
 
-# Cache the model globally to avoid reloading
+# Prompt with image token - use conversation format
+DESCRIBE_MESSAGES = [
+    {
+        "role": "user",
+        "content": [
+            {"type": "image"},
+            {"type": "text", "text": "Describe this image in one to two sentences."}
+        ]
+    }
+]
+
+# Cache the model, processor and formatted prompt globally to avoid reloading
 _model = None
 _processor = None
+_prompt = None
+
+def get_attn_implementation():
+    """Use FlashAttention-2 on Ampere+ GPUs when flash-attn is installed, else SDPA."""
+    if device == "cuda" and torch.cuda.get_device_capability(0)[0] >= 8:
+        try:
+            import flash_attn  # noqa: F401
+            return "flash_attention_2"
+        except ImportError:
+            pass
+    return "sdpa"
 
 def load_model():
     """Load the model and processor (cached)"""
-    global _model, _processor
+    global _model, _processor, _prompt
 
     if _model is None:
         print("Loading SmolVLM2 model...", file=sys.stderr)
-        _processor = AutoProcessor.from_pretrained(MODEL_ID)
+        _processor = AutoProcessor.from_pretrained(MODEL_ID, use_fast=True)
+        _prompt = _processor.apply_chat_template(DESCRIBE_MESSAGES, add_generation_prompt=True)
         # SmolVLM2 uses bfloat16 for CUDA, float32 for CPU
         dtype = torch.bfloat16 if device == "cuda" else torch.float32
         _model = AutoModelForImageTextToText.from_pretrained(
             MODEL_ID,
             dtype=dtype,
+            attn_implementation=get_attn_implementation(),
             low_cpu_mem_usage=True,
         ).to(device)
+        _model.eval()
         print(f"Model loaded on {device}", file=sys.stderr)
 
     return _model, _processor
@@ -47,46 +72,31 @@ def describe_image(image_path: str, max_tokens: int = 60) -> str:
     try:
         model, processor = load_model()
 
-        # Load image
-        image = Image.open(image_path).convert("RGB")
-
-        # Prepare prompt with image token - use conversation format
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "image"},
-                    {"type": "text", "text": "Describe this image in one to two sentences."}
-                ]
-            }
-        ]
-
-        # Format the prompt
-        prompt = processor.apply_chat_template(messages, add_generation_prompt=True)
+        # Load image, preferring the VLM-sized thumbnail written at detection time
+        thumb = Path(image_path).with_name(Path(image_path).stem + "-thumb.jpg")
+        image = Image.open(thumb if thumb.exists() else image_path).convert("RGB")
 
         # Process inputs
         inputs = processor(
-            text=prompt,
+            text=_prompt,
             images=[image],
             return_tensors="pt"
         ).to(device)
 
         # Generate description
-        with torch.no_grad():
+        with torch.inference_mode():
             outputs = model.generate(
                 **inputs,
                 max_new_tokens=max_tokens,
                 do_sample=False,
             )
 
-        # Decode output
-        description = processor.decode(outputs[0], skip_special_tokens=True)
-
-        # Extract just the response (remove prompt)
-        if "Assistant:" in description:
-            description = description.split("Assistant:")[-1].strip()
-        elif "\n\n" in description:
-            description = description.split("\n\n")[-1].strip()
+        # Decode only the newly generated tokens (skip the prompt slice)
+        prompt_len = inputs["input_ids"].shape[1]
+        description = processor.tokenizer.decode(
+            outputs[0, prompt_len:],
+            skip_special_tokens=True
+        ).strip()
 
         return description
 
@@ -7,29 +7,50 @@ Modes:
   <metadata_path> Process a single file and exit (for testing)
 
 Protocol (persistent mode):
-  Input:   DETECT|<video_path>|<upload_id>|<output_dir>   → scene detection
-  Output:  DETECT_DONE|<json_scenes_array>
+  Every message on stdin/stdout is a JSON object prefixed with its length
+  as a 4-byte big-endian integer. Logging goes to stderr.
 
-  Input:   <metadata_path>                                 → AI descriptions
-  Output:  DONE:<metadata_path>
+  Output:  {"event": "READY"}                                  → startup signal
 
-  Output:  READY                                           → startup signal
+  Input:   {"cmd": "DETECT", "video": ..., "upload_id": ..., "output_dir": ...}
+  Output:  {"event": "DETECT_DONE", "scenes": [...]}           → scene detection
+
+  Input:   {"cmd": "DESCRIBE", "metadata_path": ...}
+  Output:  {"event": "PROGRESS", "metadata_path": ..., "processingIndex": ..., "progress": ...}
+  Output:  {"event": "DONE", "metadata_path": ...}             → AI descriptions
+
+  Input:   {"cmd": "EXIT"}                                     → shut down
 """
 import sys
 import os
 import json
 from pathlib import Path
+import math
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 
+# Persist torch.compile (Inductor) artifacts so worker restarts skip recompilation
+os.environ.setdefault(
+    "TORCHINDUCTOR_CACHE_DIR",
+    str(Path(__file__).parent.parent / ".torchinductor-cache")
+)
+
 try:
-    from transformers import AutoProcessor, AutoModelForImageTextToText
+    from transformers import AutoProcessor, AutoModelForImageTextToText, CompileConfig
     from PIL import Image
     import torch
 except ImportError:
     print("ERROR: Required packages not installed. Run: pip install transformers pillow torch torchvision", file=sys.stderr)
     sys.exit(1)
 
+try:
+    from torchvision.io import decode_jpeg, ImageReadMode
+except ImportError:
+    decode_jpeg = None
+
 # Load config
 CONFIG_PATH = Path(__file__).parent.parent / "shotlister.config.json"
 config = {}
@@ -43,6 +64,9 @@ else:
 MODEL_ID = config.get("vlmModel", "HuggingFaceTB/SmolVLM2-500M-Video-Instruct")
 USE_CUDA = config.get("useCuda", True)
 SCENE_DETECTOR = config.get("sceneDetector", "pyscenedetect")
+DESCRIBE_BATCH_SIZE = max(1, int(config.get("describeBatchSize", 4)))
+TORCH_COMPILE = config.get("torchCompile", True)
+QUANTIZATION = config.get("quantization", "none")
 
 # Determine device based on config and availability
 if USE_CUDA and torch.cuda.is_available():
@@ -56,40 +80,250 @@ else:
     device = "cpu"
     print("Using CPU (CUDA disabled in config)", file=sys.stderr)
 
+# Memory budget for full-resolution frames kept during the TransNetV2 decode
+# pass, so screenshots can be written without decoding the video again
+SCREENSHOT_CACHE_BYTES = 2 * 1024 ** 3
+SCREENSHOT_JPEG_QUALITY = 85
+
+# Screenshots larger than the VLM processor's input size (its
+# size["longest_edge"], set from the processor in load_vlm_model) also get a
+# "-thumb.jpg" copy downscaled to that size, so the description pass decodes
+# a smaller image and the processor skips its longest-edge downscale. It
+# still splits the image into 512px tiles as usual, so descriptions see the
+# same detail.
+THUMBNAIL_SIZE = 2048
+THUMBNAIL_JPEG_QUALITY = 90
+
+# TransNetV2 frames are decoded and predicted in windows of this many frames.
+# Windows are multiples of 50 to line up with predict_frames' internal
+# 100-frame windows (50-frame stride, 25 frames of context on each side).
+TRANSNET_WINDOW = 1000
+TRANSNET_CONTEXT = 25
+
+# Prompt with image token - use conversation format. The templated string is
+# built once in load_vlm_model since it is the same for every scene.
+DESCRIBE_MESSAGES = [
+    {
+        "role": "user",
+        "content": [
+            {"type": "image"},
+            {"type": "text", "text": "Describe this image in one to two sentences."}
+        ]
+    }
+]
+describe_prompt = None
+
+# Side stream for the SmolVLM2 vision encoder, so the next batch's images are
+# encoded while the current batch is still decoding on the default stream
+vision_stream = torch.cuda.Stream() if device == "cuda" else None
+
+if device == "cuda":
+    # Allow TF32 matmuls and let cuDNN autotune conv kernels; the warm-up
+    # in load_vlm_model then settles kernel choices before READY
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.benchmark = True
+
 print(f"VLM Model: {MODEL_ID}", file=sys.stderr)
 print(f"Scene Detector: {SCENE_DETECTOR}", file=sys.stderr)
+print(f"Description batch size: {DESCRIBE_BATCH_SIZE}", file=sys.stderr)
+print(f"Quantization: {QUANTIZATION if device == 'cuda' else 'none (CPU)'}", file=sys.stderr)
+print(f"torch.compile: {'enabled' if TORCH_COMPILE and device == 'cuda' else 'disabled'}", file=sys.stderr)
 
 
-def update_metadata(metadata_path, **updates):
-    """Read current metadata, apply updates, write back.
+class MetadataBuffer:
+    """Buffer metadata updates in memory and flush them to disk atomically.
 
-    This prevents overwriting fields (like videoTitle/videoDescription)
-    that may have been saved by the PATCH endpoint while we're processing.
+    Flushing re-reads the file and applies the pending updates on top. This
+    prevents overwriting fields (like videoTitle/videoDescription) that may
+    have been saved by the PATCH endpoint while we're processing.
     """
-    with open(metadata_path, 'r') as f:
-        current = json.load(f)
-    current.update(updates)
-    with open(metadata_path, 'w') as f:
-        json.dump(current, f, indent=2)
-    return current
+
+    def __init__(self, path, min_interval=2.0):
+        self.path = Path(path)
+        self.min_interval = min_interval
+        self.pending = {}
+        self.last_flush = 0.0
+
+    def load(self):
+        """Read the current metadata from disk."""
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def set(self, **updates):
+        """Queue updates for the next flush."""
+        self.pending.update(updates)
+
+    def flush(self, force=False):
+        """Merge pending updates into the file, at most once per min_interval unless forced."""
+        if not self.pending:
+            return
+        if not force and time.time() - self.last_flush < self.min_interval:
+            return
+
+        current = self.load()
+        current.update(self.pending)
+        # Write to a temp file and rename so readers never see a partial file
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(current, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+        self.pending = {}
+        self.last_flush = time.time()
+
+
+class ScreenshotCache:
+    """Full-resolution frames kept during decoding, within a memory budget.
+
+    Every stride-th frame is kept. The starting stride comes from the
+    container's frame count, which can under-report or be 0, so the budget
+    is also enforced on the bytes actually held: once it is exceeded the
+    stride doubles and frames that are no longer on it are dropped.
+    """
+
+    def __init__(self, budget_bytes, stride=1):
+        self.budget_bytes = budget_bytes
+        self.stride = stride
+        self.frames = {}
+        self.nbytes = 0
+
+    def wants(self, frame_idx):
+        """Whether a frame at this index would be kept."""
+        return frame_idx % self.stride == 0
+
+    def add(self, frame_idx, frame):
+        """Keep a frame, thinning the cache if it goes over budget."""
+        self.frames[frame_idx] = frame
+        self.nbytes += frame.nbytes
+        while self.nbytes > self.budget_bytes and len(self.frames) > 1:
+            self.stride *= 2
+            for idx in [idx for idx in self.frames if idx % self.stride != 0]:
+                self.nbytes -= self.frames.pop(idx).nbytes
+
+    def get(self, frame_idx):
+        """The cached frame at exactly this index, or None."""
+        return self.frames.get(frame_idx)
+
+
+def get_quantization_config():
+    """Build the bitsandbytes quantization config for the configured mode.
+
+    The vision tower, connector and LM head stay in bfloat16: they are small,
+    and quantizing them costs more quality than it saves bandwidth.
+    """
+    if QUANTIZATION == "none" or device != "cuda":
+        return None
+
+    try:
+        from transformers import BitsAndBytesConfig
+        import bitsandbytes  # noqa: F401
+    except ImportError:
+        print("WARNING: bitsandbytes not installed, loading SmolVLM2 unquantized. Run: pip install bitsandbytes", file=sys.stderr)
+        return None
+
+    skip_modules = ["vision_model", "connector", "lm_head"]
+    if QUANTIZATION == "int8":
+        return BitsAndBytesConfig(
+            load_in_8bit=True,
+            llm_int8_skip_modules=skip_modules,
+        )
+    if QUANTIZATION == "nf4":
+        return BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_compute_dtype=torch.bfloat16,
+            llm_int8_skip_modules=skip_modules,
+        )
+
+    print(f"WARNING: Unknown quantization '{QUANTIZATION}', loading SmolVLM2 unquantized", file=sys.stderr)
+    return None
 
 
 def load_vlm_model():
     """Load the SmolVLM2 model and processor."""
+    global describe_prompt, THUMBNAIL_SIZE
+
     print(f"Loading SmolVLM2 model on {device}...", file=sys.stderr)
     start_time = time.time()
-    processor = AutoProcessor.from_pretrained(MODEL_ID)
+    processor = AutoProcessor.from_pretrained(MODEL_ID, use_fast=True)
+    describe_prompt = processor.apply_chat_template(DESCRIBE_MESSAGES, add_generation_prompt=True)
+    THUMBNAIL_SIZE = processor.image_processor.size.get("longest_edge", THUMBNAIL_SIZE)
+    # Left-pad so batched generate appends new tokens right after each prompt
+    processor.tokenizer.padding_side = "left"
     dtype = torch.bfloat16 if device == "cuda" else torch.float32
-    model = AutoModelForImageTextToText.from_pretrained(
-        MODEL_ID,
-        dtype=dtype,
-        low_cpu_mem_usage=True,
-    ).to(device)
+    quantization_config = get_quantization_config()
+    if quantization_config is not None:
+        # bitsandbytes places the quantized weights on the GPU itself
+        model = AutoModelForImageTextToText.from_pretrained(
+            MODEL_ID,
+            dtype=dtype,
+            quantization_config=quantization_config,
+            device_map=device,
+            attn_implementation="sdpa",
+            low_cpu_mem_usage=True,
+        )
+    else:
+        # SDPA rather than flash-attn: it composes with the static cache and
+        # torch.compile, and picks the flash kernel itself when shapes allow
+        model = AutoModelForImageTextToText.from_pretrained(
+            MODEL_ID,
+            dtype=dtype,
+            attn_implementation="sdpa",
+            low_cpu_mem_usage=True,
+        ).to(device)
+    model.eval()
     load_time = time.time() - start_time
     print(f"SmolVLM2 loaded in {load_time:.1f}s", file=sys.stderr)
+
+    # With a static KV cache, generate compiles the decode-step forward
+    # itself: shapes stay fixed, so the CUDA graphs recorded by
+    # reduce-overhead are replayed instead of re-traced as the cache grows
+    optimized = TORCH_COMPILE and device == "cuda"
+    if optimized:
+        print("Compiling SmolVLM2 with torch.compile (first run may take a minute)...", file=sys.stderr)
+        model.generation_config.cache_implementation = "static"
+        model.generation_config.compile_config = CompileConfig(fullgraph=False, mode="reduce-overhead")
+    else:
+        model.generation_config.disable_compile = True
+
+    # Warm up before READY so compilation is paid before Node.js sends work
+    start_time = time.time()
+    try:
+        warm_up_vlm(model, processor)
+    except Exception as e:
+        if not optimized:
+            raise
+        print(f"WARNING: Optimized generate failed ({e}), falling back to eager mode with a dynamic cache", file=sys.stderr)
+        model.generation_config.disable_compile = True
+        model.generation_config.cache_implementation = None
+        warm_up_vlm(model, processor)
+    warmup_time = time.time() - start_time
+    print(f"SmolVLM2 warmed up in {warmup_time:.1f}s", file=sys.stderr)
+
     return processor, model
 
 
+def warm_up_vlm(model, processor):
+    """Run descriptions on dummy thumbnails before READY.
+
+    This triggers compilation and populates the allocator pools and kernel
+    autotuning caches, so the first real scene isn't slower than the rest.
+    On CUDA every batch size from DESCRIBE_BATCH_SIZE down to 1 is run,
+    since a file's last batch can be partial and each size gets its own
+    static cache and CUDA graphs. The dummies are 16:9 frames at the
+    processor's input size, so they are tiled like typical screenshots and
+    the padded prompt length matches too. On CPU nothing is compiled, so a
+    single short call is enough.
+    """
+    dummy = Image.new("RGB", (THUMBNAIL_SIZE, THUMBNAIL_SIZE * 9 // 16))
+    with torch.inference_mode():
+        if device != "cuda":
+            generate_descriptions([dummy], model, processor, max_tokens=8)
+            return
+        for batch_size in range(DESCRIBE_BATCH_SIZE, 0, -1):
+            generate_descriptions([dummy] * batch_size, model, processor)
+
+
 def load_transnet_model():
     """Load TransNetV2 model for scene detection."""
     try:
@@ -115,6 +349,200 @@ def format_timecode(seconds):
     return f"{hours:02d}:{minutes:02d}:{secs:06.3f}"
 
 
+def read_transnet_windows(cap, free_buffers, ready, screenshot_cache):
+    """Decode frames into 48x27 RGB windows for TransNetV2 (producer thread).
+
+    Takes empty window buffers from free_buffers (None means stop), fills
+    them and puts (buffer, frame_count) on ready, followed by None at the
+    end of the video - or the exception if decoding failed. Full-resolution
+    frames are kept in screenshot_cache for writing screenshots later.
+    """
+    import cv2
+
+    try:
+        small_bgr = np.empty((27, 48, 3), dtype=np.uint8)
+        frame_idx = 0
+        while True:
+            buffer = free_buffers.get()
+            if buffer is None:
+                return
+            buffer_np = buffer.numpy()
+
+            n = 0
+            while n < len(buffer_np):
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if screenshot_cache.wants(frame_idx):
+                    screenshot_cache.add(frame_idx, frame)
+                # OpenCV reads BGR, TransNetV2 expects RGB: resize first, then
+                # reverse the channels while copying into the window slot
+                cv2.resize(frame, (48, 27), dst=small_bgr)
+                np.copyto(buffer_np[n], small_bgr[:, :, ::-1])
+                n += 1
+                frame_idx += 1
+
+            if n > 0:
+                ready.put((buffer, n))
+            if n < len(buffer_np):
+                break
+        ready.put(None)
+    except Exception as e:
+        ready.put(e)
+
+
+def open_nvdec(video_path):
+    """Open a PyNvVideoCodec demuxer/decoder for 8-bit 4:2:0 H.264/H.265 video.
+
+    Returns (demuxer, decoder), or None if PyNvVideoCodec isn't installed or
+    the stream isn't supported, in which case the caller decodes with OpenCV.
+    Higher bit depths (e.g. 10-bit HDR HEVC) decode to P016 rather than NV12
+    and other chroma formats have a different plane layout, so both are left
+    to OpenCV.
+    """
+    try:
+        import PyNvVideoCodec as nvc
+    except ImportError:
+        return None
+
+    try:
+        demuxer = nvc.CreateDemuxer(filename=video_path)
+        codec = demuxer.GetNvCodecId()
+        if codec not in (nvc.cudaVideoCodec.H264, nvc.cudaVideoCodec.HEVC):
+            return None
+        if demuxer.BitDepth() != 8 or not str(demuxer.ChromaFormat()).endswith("420"):
+            return None
+        decoder = nvc.CreateDecoder(
+            gpuid=0, codec=codec, cudacontext=0, cudastream=0, usedevicememory=True
+        )
+    except Exception as e:
+        print(f"WARNING: NVDEC unavailable ({e}), decoding with OpenCV", file=sys.stderr)
+        return None
+    return demuxer, decoder
+
+
+def nv12_to_rgb(nv12, size=None):
+    """Convert an NV12 GPU frame of shape (H * 3/2, W) to an HWC uint8 RGB tensor.
+
+    If size is given as (width, height), the planes are area-resized before
+    the color conversion so only the small output is converted (BT.709).
+    """
+    import torch.nn.functional as F
+
+    height, width = nv12.shape[0] * 2 // 3, nv12.shape[1]
+    y = nv12[:height].float()[None, None]
+    uv = nv12[height:].reshape(height // 2, width // 2, 2).permute(2, 0, 1).float()[None]
+    if size is not None:
+        y = F.interpolate(y, size=(size[1], size[0]), mode="area")
+        uv = F.interpolate(uv, size=(size[1], size[0]), mode="area")
+    else:
+        uv = F.interpolate(uv, size=(height, width), mode="nearest")
+
+    y = (y[0, 0] - 16) * 1.164
+    u = uv[0, 0] - 128
+    v = uv[0, 1] - 128
+    rgb = torch.stack([
+        y + 1.793 * v,
+        y - 0.213 * u - 0.533 * v,
+        y + 2.112 * u,
+    ], dim=-1)
+    return rgb.clamp(0, 255).to(torch.uint8)
+
+
+def read_transnet_windows_nvdec(nvdec, free_buffers, ready, screenshot_cache):
+    """NVDEC variant of read_transnet_windows.
+
+    Frames are decoded into GPU memory and downscaled there, filling window
+    buffers that already live on the device. Cached screenshot frames are
+    converted to BGR and copied back to the CPU for cv2.imwrite.
+    """
+    demuxer, decoder = nvdec
+
+    def decoded_frames():
+        for packet in demuxer:
+            for frame in decoder.Decode(packet):
+                yield torch.from_dlpack(frame)
+
+    try:
+        frames = decoded_frames()
+        frame_idx = 0
+        while True:
+            buffer = free_buffers.get()
+            if buffer is None:
+                return
+
+            n = 0
+            while n < len(buffer):
+                nv12 = next(frames, None)
+                if nv12 is None:
+                    break
+                if screenshot_cache.wants(frame_idx):
+                    screenshot_cache.add(frame_idx, nv12_to_rgb(nv12).flip(-1).cpu().numpy())
+                buffer[n] = nv12_to_rgb(nv12, size=(48, 27))
+                n += 1
+                frame_idx += 1
+
+            if n > 0:
+                ready.put((buffer, n))
+            if n < len(buffer):
+                break
+        ready.put(None)
+    except Exception as e:
+        ready.put(e)
+
+
+def predict_transnet_streaming(transnet_model, ready, free_buffers):
+    """Run TransNetV2 window by window as frames arrive from the reader.
+
+    Each window is predicted together with the last 50-frame block of the
+    previous one, and only predictions with TRANSNET_CONTEXT frames of real
+    context on both sides are kept, so the stitched result matches a single
+    whole-video predict_frames call. Returns (predictions, frame_count).
+    """
+    predictions = []
+    pending = torch.empty((0, 27, 48, 3), dtype=torch.uint8, device=transnet_model.device)
+    pending_start = 0   # frame index of pending[0], always a multiple of 50
+    predicted_upto = 0  # predictions are final for frames before this index
+
+    while True:
+        item = ready.get()
+        if isinstance(item, Exception):
+            raise item
+        final = item is None
+
+        if not final:
+            buffer, n = item
+            # Pinned buffer lets the host-to-device copy run asynchronously
+            # (a no-op for NVDEC buffers, which are already on the device)
+            chunk = buffer[:n].to(transnet_model.device, non_blocking=True)
+            pending = torch.cat([pending, chunk])
+            if device == "cuda":
+                torch.cuda.current_stream().synchronize()
+            free_buffers.put(buffer)
+
+        # Frames near the end of a window lack right context until more arrive
+        keep_from = predicted_upto - pending_start
+        keep_to = len(pending) if final else (len(pending) - TRANSNET_CONTEXT) // 50 * 50
+        if keep_to > keep_from:
+            # bfloat16 autocast halves activation bandwidth through the convnet;
+            # TransNetV2 scores saturate far from the 0.5 threshold
+            with torch.inference_mode(), torch.autocast(
+                device_type="cuda", dtype=torch.bfloat16, enabled=(device == "cuda")
+            ):
+                single_frame_pred, _ = transnet_model.predict_frames(pending, quiet=True)
+            predictions.append(single_frame_pred[keep_from:keep_to].float().cpu().numpy())
+            predicted_upto = pending_start + keep_to
+
+            # Keep one 50-frame block before the first unpredicted frame as context
+            new_start = max(0, predicted_upto - 50)
+            pending = pending[new_start - pending_start:]
+            pending_start = new_start
+
+        if final:
+            frame_count = pending_start + len(pending)
+            return (np.concatenate(predictions) if predictions else None), frame_count
+
+
 def detect_scenes_transnet(video_path, upload_id, output_dir, transnet_model):
     """Detect scenes using TransNetV2 and extract screenshots with OpenCV."""
     import cv2
@@ -131,32 +559,59 @@ def detect_scenes_transnet(video_path, upload_id, output_dir, transnet_model):
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     print(f"Video: {total_frames} frames @ {fps:.2f} fps ({total_frames/fps:.1f}s)", file=sys.stderr)
 
-    # Read all frames resized to 48x27 for TransNetV2
-    print("Reading frames for TransNetV2...", file=sys.stderr)
+    # Keep full-resolution frames for screenshots while decoding: every frame
+    # if they fit in the budget, otherwise every Nth frame. The frame count
+    # only seeds the stride; the cache thins itself if the count is wrong.
+    frame_bytes = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) * int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) * 3
+    screenshot_cache = ScreenshotCache(
+        SCREENSHOT_CACHE_BYTES,
+        stride=max(1, math.ceil(max(total_frames, 0) * frame_bytes / SCREENSHOT_CACHE_BYTES)),
+    )
+
+    # Decode on a producer thread while TransNetV2 predicts window by window,
+    # so peak memory is bounded by the window size rather than video length
+    print("Running TransNetV2 on streamed frames...", file=sys.stderr)
     start_time = time.time()
-    frames = []
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        # OpenCV reads BGR, TransNetV2 expects RGB
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        frames.append(cv2.resize(frame_rgb, (48, 27)))
-    cap.release()
-    read_time = time.time() - start_time
-    print(f"Read {len(frames)} frames in {read_time:.1f}s", file=sys.stderr)
-
-    if not frames:
+
+    # Decode on the GPU with NVDEC when available, so frames never pass
+    # through the CPU; otherwise decode with OpenCV into pinned buffers
+    nvdec = open_nvdec(video_path) if device == "cuda" else None
+    if nvdec is not None:
+        print("Decoding with NVDEC", file=sys.stderr)
+        reader_target = read_transnet_windows_nvdec
+        reader_source = nvdec
+        buffer_device = device
+    else:
+        reader_target = read_transnet_windows
+        reader_source = cap
+        buffer_device = "cpu"
+
+    free_buffers = queue.Queue()
+    for _ in range(3):
+        free_buffers.put(torch.empty(
+            (TRANSNET_WINDOW, 27, 48, 3), dtype=torch.uint8, device=buffer_device,
+            pin_memory=(device == "cuda" and buffer_device == "cpu")
+        ))
+    ready = queue.Queue()
+    reader = threading.Thread(
+        target=reader_target,
+        args=(reader_source, free_buffers, ready, screenshot_cache),
+        daemon=True,
+    )
+    reader.start()
+    try:
+        single_frame_np, frame_count = predict_transnet_streaming(transnet_model, ready, free_buffers)
+    finally:
+        # Unblock the reader if prediction stopped early
+        free_buffers.put(None)
+        reader.join()
+        cap.release()
+    print(f"Processed {frame_count} frames in {time.time() - start_time:.1f}s (caching every {screenshot_cache.stride} frame(s) for screenshots)", file=sys.stderr)
+
+    if frame_count == 0:
         print("ERROR: No frames read from video", file=sys.stderr)
         return []
 
-    # Run TransNetV2 inference
-    print("Running TransNetV2 inference...", file=sys.stderr)
-    start_time = time.time()
-    video_tensor = torch.from_numpy(np.array(frames)).to(transnet_model.device)
-    single_frame_pred, _ = transnet_model.predict_frames(video_tensor, quiet=True)
-    single_frame_np = single_frame_pred.cpu().detach().numpy()
-
     # Convert predictions to structured scene data
     scene_data = transnet_model.predictions_to_scenes_with_data(
         single_frame_np, fps=fps, threshold=0.5
@@ -164,87 +619,240 @@ def detect_scenes_transnet(video_path, upload_id, output_dir, transnet_model):
     infer_time = time.time() - start_time
     print(f"TransNetV2 detected {len(scene_data)} scenes in {infer_time:.1f}s", file=sys.stderr)
 
-    # Extract screenshots at the start frame of each scene
+    # Extract screenshots at the start of each scene from the cached frames.
+    # JPEG encoding releases the GIL, so writes run in parallel on a pool.
     print("Extracting screenshots...", file=sys.stderr)
     video_basename = Path(video_path).stem
-    cap = cv2.VideoCapture(video_path)
+    cap = None
     scenes = []
 
-    for i, scene in enumerate(scene_data):
-        start_frame = scene['start_frame']
-        timestamp = start_frame / fps
-        timecode = format_timecode(timestamp)
-        filename = f"{video_basename}-Scene-{i+1:03d}-01.jpg"
-        filepath = os.path.join(output_dir, filename)
-
-        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
-        ret, frame = cap.read()
-        if ret:
-            cv2.imwrite(filepath, frame)
-
-        scenes.append({
-            "timestamp": round(timestamp, 3),
-            "timecode": timecode,
-            "screenshotPath": f"/uploads/scenes/{upload_id}/{filename}"
-        })
-
-    cap.release()
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        writes = []
+        for i, scene in enumerate(scene_data):
+            start_frame = scene['start_frame']
+            timestamp = start_frame / fps
+            timecode = format_timecode(timestamp)
+            filename = f"{video_basename}-Scene-{i+1:03d}-01.jpg"
+            filepath = os.path.join(output_dir, filename)
+
+            # Use the cached start frame if it was kept, so the screenshot
+            # always matches the scene's timestamp
+            frame = screenshot_cache.get(start_frame)
+
+            if frame is None:
+                # Start frame not on the cache stride - seek for the exact frame
+                if cap is None:
+                    cap = cv2.VideoCapture(video_path)
+                cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+                ret, frame = cap.read()
+                if not ret:
+                    frame = None
+
+            if frame is not None:
+                writes.append(executor.submit(write_screenshot, filepath, frame))
+
+            scenes.append({
+                "timestamp": round(timestamp, 3),
+                "timecode": timecode,
+                "screenshotPath": f"/uploads/scenes/{upload_id}/{filename}"
+            })
+
+        for write in writes:
+            write.result()
+
+    if cap is not None:
+        cap.release()
     print(f"Saved {len(scenes)} screenshots", file=sys.stderr)
     return scenes
 
 
-def describe_image(image_path: str, model, processor, max_tokens: int = 60) -> str:
-    """Generate a description for an image"""
-    try:
-        # Load image
-        image = Image.open(image_path).convert("RGB")
-
-        # Prepare prompt with image token - use conversation format
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "image"},
-                    {"type": "text", "text": "Describe this image in one to two sentences."}
-                ]
-            }
-        ]
+def write_screenshot(filepath, frame):
+    """Write a scene screenshot as a JPEG, plus a VLM-sized thumbnail if it's larger."""
+    import cv2
 
-        # Format the prompt
-        prompt = processor.apply_chat_template(messages, add_generation_prompt=True)
+    cv2.imwrite(filepath, frame, [cv2.IMWRITE_JPEG_QUALITY, SCREENSHOT_JPEG_QUALITY])
+    thumbnail = make_thumbnail(frame)
+    if thumbnail is not frame:
+        cv2.imwrite(str(thumbnail_path(filepath)), thumbnail, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_JPEG_QUALITY])
 
-        # Process inputs
-        inputs = processor(
-            text=prompt,
-            images=[image],
-            return_tensors="pt"
-        ).to(device)
 
-        # Generate description
-        with torch.no_grad():
-            outputs = model.generate(
-                **inputs,
-                max_new_tokens=max_tokens,
-                do_sample=False,
-            )
+def thumbnail_path(image_path):
+    """Path of the VLM-sized thumbnail written next to a screenshot."""
+    image_path = Path(image_path)
+    return image_path.with_name(image_path.stem + "-thumb.jpg")
 
-        # Decode output
-        description = processor.decode(outputs[0], skip_special_tokens=True)
 
-        # Extract just the response (remove prompt)
-        if "Assistant:" in description:
-            description = description.split("Assistant:")[-1].strip()
-        elif "\n\n" in description:
-            description = description.split("\n\n")[-1].strip()
+def make_thumbnail(frame):
+    """Downscale a BGR frame so its longest edge is at most THUMBNAIL_SIZE.
 
-        return description
+    Frames that already fit are returned as is.
+    """
+    import cv2
 
-    except Exception as e:
-        return f"Error: {str(e)}"
+    height, width = frame.shape[:2]
+    scale = THUMBNAIL_SIZE / max(height, width)
+    if scale >= 1:
+        return frame
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+def load_image(image_path):
+    """Load a screenshot for the VLM, preferring its thumbnail if present.
+
+    On CUDA, JPEGs are decoded straight into GPU memory with nvJPEG and
+    returned as a CHW uint8 tensor. Otherwise a PIL image is returned, with
+    libjpeg decoding at reduced scale where possible.
+    """
+    image_path = Path(image_path)
+    thumb = thumbnail_path(image_path)
+    if thumb.exists():
+        image_path = thumb
+    if device == "cuda" and decode_jpeg is not None and image_path.suffix.lower() in (".jpg", ".jpeg"):
+        with open(image_path, 'rb') as f:
+            raw = torch.frombuffer(bytearray(f.read()), dtype=torch.uint8)
+        return decode_jpeg(raw, mode=ImageReadMode.RGB, device=device)
+
+    image = Image.open(image_path)
+    image.draft("RGB", (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    return image.convert("RGB")
+
+
+def encode_batch(images, model, processor):
+    """Preprocess a batch of images and launch the vision encoder.
+
+    On CUDA the encoder runs on a side stream, so encoding the next batch can
+    overlap with a generate call that is still decoding the current one.
+    Returns the keyword arguments for generate_from_encoded.
+    """
+    # Process inputs - one prompt and one image per batch entry,
+    # left-padded so every sequence ends at the generation boundary.
+    # Prompt lengths are bucketed to a multiple of 32 so the static cache
+    # and compiled graph are reused across calls instead of recompiled.
+    inputs = processor(
+        text=[describe_prompt] * len(images),
+        images=[[image] for image in images],
+        padding=True,
+        pad_to_multiple_of=32,
+        return_tensors="pt"
+    ).to(device)
+
+    if vision_stream is None or not hasattr(model, "get_image_features"):
+        return dict(inputs)
+
+    # Encode on the side stream once the inputs have been copied to the GPU.
+    # Every tensor it reads is recorded on it, so the allocator doesn't hand
+    # their memory to the default stream while the encoder is still running.
+    pixel_values = inputs["pixel_values"]
+    pixel_attention_mask = inputs.get("pixel_attention_mask")
+    vision_stream.wait_stream(torch.cuda.current_stream())
+    for tensor in (pixel_values, pixel_attention_mask):
+        if tensor is not None:
+            tensor.record_stream(vision_stream)
+    with torch.inference_mode(), torch.cuda.stream(vision_stream):
+        image_hidden_states = model.get_image_features(
+            pixel_values=pixel_values,
+            pixel_attention_mask=pixel_attention_mask,
+        )
+        # Mark the end of this batch's encoding only; later batches queued on
+        # the same stream must not hold up this batch's generate call.
+        vision_done = torch.cuda.Event()
+        vision_done.record(vision_stream)
+
+    return {
+        "input_ids": inputs["input_ids"],
+        "attention_mask": inputs["attention_mask"],
+        "image_hidden_states": image_hidden_states,
+        "vision_done": vision_done,
+    }
+
+
+def generate_from_encoded(encoded, model, processor, max_tokens: int = 60) -> list:
+    """Run generate on a batch prepared by encode_batch.
+
+    Returns one description per image, in order. Raises on failure.
+    """
+    vision_done = encoded.pop("vision_done", None)
+    if vision_done is not None:
+        # Wait for this batch's vision encoder before the language model consumes its output
+        torch.cuda.current_stream().wait_event(vision_done)
+        encoded["image_hidden_states"].record_stream(torch.cuda.current_stream())
+
+    # Generate descriptions for the whole batch at once
+    with torch.inference_mode():
+        outputs = model.generate(
+            **encoded,
+            max_new_tokens=max_tokens,
+            min_new_tokens=1,
+            do_sample=False,
+            use_cache=True,
+        )
+
+    # Decode only the newly generated tokens (skip the prompt slice)
+    prompt_len = encoded["input_ids"].shape[1]
+    descriptions = processor.tokenizer.batch_decode(
+        outputs[:, prompt_len:],
+        skip_special_tokens=True
+    )
+    return [description.strip() for description in descriptions]
 
 
-def process_file(metadata_path_str, model, processor):
-    """Process all scenes in a single metadata file."""
+def generate_descriptions(images, model, processor, max_tokens: int = 60) -> list:
+    """Generate descriptions for a batch of images in a single generate call.
+
+    Returns one description per input image, in order. Raises on failure.
+    """
+    encoded = encode_batch(images, model, processor)
+    return generate_from_encoded(encoded, model, processor, max_tokens)
+
+
+def load_scene_images(image_paths):
+    """Load screenshots for a batch of scenes.
+
+    Takes (scene_index, image_path) pairs and returns (images, image_indices,
+    failures), where failures maps a scene index to its fallback description.
+    Does not touch the scenes list, so it is safe to run on a worker thread.
+    """
+    images = []
+    image_indices = []
+    failures = {}
+    for i, image_path in image_paths:
+        if not image_path.exists():
+            print(f"WARNING: Image not found: {image_path}", file=sys.stderr)
+            failures[i] = 'Scene from video'
+            continue
+
+        try:
+            images.append(load_image(image_path))
+            image_indices.append(i)
+        except Exception as e:
+            failures[i] = f"Error: {str(e)}"
+
+    return images, image_indices, failures
+
+
+def read_message(stream):
+    """Read one length-prefixed JSON message, or None at end of stream."""
+    header = stream.read(4)
+    if len(header) < 4:
+        return None
+    length = int.from_bytes(header, "big")
+    return json.loads(stream.read(length).decode("utf-8"))
+
+
+def write_message(stream, message):
+    """Write one length-prefixed JSON message."""
+    payload = json.dumps(message).encode("utf-8")
+    stream.write(len(payload).to_bytes(4, "big") + payload)
+    stream.flush()
+
+
+def process_file(metadata_path_str, model, processor, on_progress=None):
+    """Process all scenes in a single metadata file.
+
+    If given, on_progress is called with processingIndex/progress whenever
+    they change, independently of the rate-limited metadata flushes.
+    """
     metadata_path = Path(metadata_path_str)
 
     if not metadata_path.exists():
@@ -252,8 +860,8 @@ def process_file(metadata_path_str, model, processor):
         return
 
     # Load metadata
-    with open(metadata_path, 'r') as f:
-        metadata = json.load(f)
+    metadata_file = MetadataBuffer(metadata_path)
+    metadata = metadata_file.load()
 
     scenes = metadata.get('scenes', [])
 
@@ -264,48 +872,93 @@ def process_file(metadata_path_str, model, processor):
     scenes_dir = metadata_path.parent
     total = len(scenes)
 
+    # Collect scenes that still need a description
+    pending = []
     for i, scene in enumerate(scenes):
-        # Skip if already has description
         if scene.get('description'):
             print(f"[{i+1}/{total}] Skipping scene {i+1} (already has description)", file=sys.stderr)
-            continue
-
-        print(f"[{i+1}/{total}] Processing scene {i+1}...", file=sys.stderr)
-
-        # Set processingIndex BEFORE processing so frontend shows correct status
-        update_metadata(metadata_path,
-            processingIndex=i,
-            scenes=scenes,
-            descriptionsComplete=False,
-            progress=round((i / total) * 100)
-        )
+        else:
+            pending.append(i)
+
+    batches = [pending[start:start + DESCRIBE_BATCH_SIZE] for start in range(0, len(pending), DESCRIBE_BATCH_SIZE)]
+
+    # Screenshots are read and decoded on worker threads ahead of encoding,
+    # so file I/O and JPEG decode overlap with generate on the GPU
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        image_loads = {}
+
+        def prefetch(k):
+            if k < len(batches):
+                image_paths = [(i, scenes_dir / Path(scenes[i]['screenshotPath']).name) for i in batches[k]]
+                image_loads[k] = executor.submit(load_scene_images, image_paths)
+
+        def start_batch(k):
+            """Collect a batch's prefetched screenshots and launch their vision encoding."""
+            images, image_indices, failures = image_loads.pop(k).result()
+            prefetch(k + 1)
+
+            for i, description in failures.items():
+                scenes[i]['description'] = description
+
+            if not images:
+                return [], None
+            try:
+                return image_indices, encode_batch(images, model, processor)
+            except Exception as e:
+                for i in image_indices:
+                    scenes[i]['description'] = f"Error: {str(e)}"
+                return [], None
+
+        prefetch(0)
+        next_batch = start_batch(0) if batches else None
+
+        for k, batch in enumerate(batches):
+            first, last = batch[0], batch[-1]
+
+            print(f"[{first+1}-{last+1}/{total}] Processing {len(batch)} scene(s)...", file=sys.stderr)
+
+            # Set processingIndex BEFORE processing so frontend shows correct status
+            metadata_file.set(
+                processingIndex=first,
+                scenes=scenes,
+                descriptionsComplete=False,
+                progress=round((first / total) * 100)
+            )
+            metadata_file.flush(force=(k == 0))
+            if on_progress is not None:
+                on_progress(processingIndex=first, progress=round((first / total) * 100))
 
-        # Get image path
-        screenshot_filename = Path(scene['screenshotPath']).name
-        image_path = scenes_dir / screenshot_filename
+            # Launch the next batch's vision encoding before decoding this one
+            image_indices, encoded = next_batch
+            next_batch = start_batch(k + 1) if k + 1 < len(batches) else None
 
-        if not image_path.exists():
-            print(f"WARNING: Image not found: {image_path}", file=sys.stderr)
-            scene['description'] = 'Scene from video'
-        else:
-            # Generate description
-            description = describe_image(str(image_path), model, processor)
-            scene['description'] = description
-            print(f"  → {description}", file=sys.stderr)
-
-        # Save again after description is generated
-        update_metadata(metadata_path,
-            scenes=scenes,
-            progress=round(((i + 1) / total) * 100)
-        )
+            # Generate descriptions for the whole batch
+            if encoded is not None:
+                try:
+                    descriptions = generate_from_encoded(encoded, model, processor)
+                except Exception as e:
+                    descriptions = [f"Error: {str(e)}"] * len(image_indices)
+                for i, description in zip(image_indices, descriptions):
+                    scenes[i]['description'] = description
+                    print(f"  [{i+1}] → {description}", file=sys.stderr)
+
+            # Save again after the batch is described
+            metadata_file.set(
+                scenes=scenes,
+                progress=round(((last + 1) / total) * 100)
+            )
+            metadata_file.flush()
+            if on_progress is not None:
+                on_progress(processingIndex=first, progress=round(((last + 1) / total) * 100))
 
     # Mark as complete
-    update_metadata(metadata_path,
+    metadata_file.set(
         processingIndex=-1,
         descriptionsComplete=True,
         progress=100,
         scenes=scenes
     )
+    metadata_file.flush(force=True)
 
     print(f"Completed processing {total} scenes!", file=sys.stderr)
 
@@ -314,6 +967,15 @@ def main():
     if len(sys.argv) >= 2 and sys.argv[1] == '--persistent':
         # Persistent mode: load models once, process commands from stdin
 
+        # Keep a private copy of stdout for framed protocol messages and point
+        # fd 1 itself at stderr: anything else written to stdout, including by
+        # native code (OpenCV/ffmpeg, CUDA libraries), would corrupt the framing
+        protocol_in = sys.stdin.buffer
+        sys.stdout.flush()
+        protocol_out = os.fdopen(os.dup(1), "wb")
+        os.dup2(2, 1)
+        sys.stdout = sys.stderr
+
         # Load TransNetV2 if configured
         transnet_model = None
         if SCENE_DETECTOR == "transnetv2":
@@ -325,23 +987,23 @@ def main():
         processor, vlm_model = load_vlm_model()
 
         # Signal to Node.js that all models are ready
-        print("READY", flush=True)
+        write_message(protocol_out, {"event": "READY"})
 
         # Read commands from stdin
-        for line in sys.stdin:
-            line = line.strip()
-            if not line or line == "EXIT":
+        while True:
+            try:
+                message = read_message(protocol_in)
+            except ValueError as e:
+                print(f"ERROR: Invalid message: {e}", file=sys.stderr)
+                break
+            if message is None or message.get("cmd") == "EXIT":
                 break
 
-            if line.startswith("DETECT|"):
-                # Scene detection command: DETECT|<video_path>|<upload_id>|<output_dir>
-                parts = line.split("|")
-                if len(parts) != 4:
-                    print(f"ERROR: Invalid DETECT command: {line}", file=sys.stderr)
-                    print(f"DETECT_DONE|[]", flush=True)
-                    continue
-
-                video_path, upload_id, output_dir = parts[1], parts[2], parts[3]
+            cmd = message.get("cmd")
+            if cmd == "DETECT":
+                video_path = message.get("video")
+                upload_id = message.get("upload_id")
+                output_dir = message.get("output_dir")
                 print(f"\n--- Detecting scenes: {video_path} ---", file=sys.stderr)
 
                 try:
@@ -354,16 +1016,22 @@ def main():
                     print(f"ERROR detecting scenes: {e}", file=sys.stderr)
                     scenes = []
 
-                print(f"DETECT_DONE|{json.dumps(scenes)}", flush=True)
-            else:
-                # Description command: <metadata_path>
-                print(f"\n--- Processing descriptions: {line} ---", file=sys.stderr)
+                write_message(protocol_out, {"event": "DETECT_DONE", "scenes": scenes})
+            elif cmd == "DESCRIBE":
+                metadata_path = message.get("metadata_path")
+                print(f"\n--- Processing descriptions: {metadata_path} ---", file=sys.stderr)
+
+                def send_progress(**progress):
+                    write_message(protocol_out, {"event": "PROGRESS", "metadata_path": metadata_path, **progress})
+
                 try:
-                    process_file(line, vlm_model, processor)
+                    process_file(metadata_path, vlm_model, processor, on_progress=send_progress)
                 except Exception as e:
-                    print(f"ERROR processing {line}: {e}", file=sys.stderr)
+                    print(f"ERROR processing {metadata_path}: {e}", file=sys.stderr)
 
-                print(f"DONE:{line}", flush=True)
+                write_message(protocol_out, {"event": "DONE", "metadata_path": metadata_path})
+            else:
+                print(f"ERROR: Unknown command: {message}", file=sys.stderr)
 
         print("Python worker exiting", file=sys.stderr)
 
@@ -1,144 +1,209 @@
 #!/usr/bin/env python3
 """
 SmolVLM2 HTTP server - keeps model loaded in memory for fast inference
+
+Requests to /describe are queued and coalesced into GPU batches: a single
+background task collects up to MAX_BATCH_SIZE waiting requests (waiting at
+most MAX_BATCH_WAIT seconds) and describes them in one generate call.
 """
 import sys
-import json
+import asyncio
+from contextlib import asynccontextmanager
 from pathlib import Path
-from http.server import HTTPServer, BaseHTTPRequestHandler
-import urllib.parse
 
 try:
     from transformers import AutoProcessor, AutoModelForImageTextToText
     from PIL import Image
     import torch
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+    import uvicorn
 except ImportError:
-    print("Error: Required packages not installed. Run: pip install transformers pillow torch torchvision", file=sys.stderr)
+    print("Error: Required packages not installed. Run: pip install transformers pillow torch torchvision fastapi uvicorn[standard]", file=sys.stderr)
     sys.exit(1)
 
+from describe_scene import get_attn_implementation
+
 # Model configuration
 MODEL_ID = "HuggingFaceTB/SmolVLM-Instruct"
 device = "cuda" if torch.cuda.is_available() else "cpu"
 
+if device == "cuda":
+    # Allow TF32 matmuls and let cuDNN autotune conv kernels during warm-up
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.benchmark = True
+
+# Micro-batching configuration
+MAX_BATCH_SIZE = 8
+MAX_BATCH_WAIT = 0.02  # seconds
+
+
 print(f"Loading SmolVLM2 model on {device}...", file=sys.stderr)
-processor = AutoProcessor.from_pretrained(MODEL_ID)
+processor = AutoProcessor.from_pretrained(MODEL_ID, use_fast=True)
+# Left-pad so batched generate appends new tokens right after each prompt
+processor.tokenizer.padding_side = "left"
 model = AutoModelForImageTextToText.from_pretrained(
     MODEL_ID,
-    torch_dtype=torch.float16 if device == "cuda" else torch.float32,
+    # SmolVLM2 was trained in bfloat16; float16 risks attention overflow
+    dtype=torch.bfloat16 if device == "cuda" else torch.float32,
+    attn_implementation=get_attn_implementation(),
     low_cpu_mem_usage=True,
 ).to(device)
+model.eval()
 print(f"Model loaded successfully!", file=sys.stderr)
 
-def describe_image(image_path: str, max_tokens: int = 50) -> str:
-    """Generate a description for an image"""
-    try:
-        # Load image
-        image = Image.open(image_path).convert("RGB")
-
-        # Prepare prompt with image token - use conversation format
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "image"},
-                    {"type": "text", "text": "Describe this scene in one concise sentence (10-15 words max)."}
-                ]
-            }
+# Prepare prompt with image token - use conversation format.
+# The prompt never changes, so it is templated once at startup.
+DESCRIBE_MESSAGES = [
+    {
+        "role": "user",
+        "content": [
+            {"type": "image"},
+            {"type": "text", "text": "Describe this scene in one concise sentence (10-15 words max)."}
         ]
+    }
+]
+PROMPT = processor.apply_chat_template(DESCRIBE_MESSAGES, add_generation_prompt=True)
+
+
+def generate_descriptions(images, max_tokens: int = 50) -> list:
+    """Generate descriptions for loaded images in a single generate call"""
+    # Process inputs - one prompt and one image per batch entry
+    inputs = processor(
+        text=[PROMPT] * len(images),
+        images=[[image] for image in images],
+        padding=True,
+        return_tensors="pt"
+    ).to(device)
+
+    # Generate descriptions
+    with torch.inference_mode():
+        outputs = model.generate(
+            **inputs,
+            max_new_tokens=max_tokens,
+            do_sample=False,
+        )
+
+    # Decode only the newly generated tokens (skip the prompt slice)
+    prompt_len = inputs["input_ids"].shape[1]
+    descriptions = processor.tokenizer.batch_decode(
+        outputs[:, prompt_len:],
+        skip_special_tokens=True
+    )
+    return [description.strip() for description in descriptions]
+
+
+def describe_batch(image_paths, max_tokens: int = 50) -> list:
+    """Generate descriptions for a batch of image paths"""
+    descriptions = [None] * len(image_paths)
+
+    # Load images, recording per-image errors
+    images = []
+    image_indices = []
+    for i, image_path in enumerate(image_paths):
+        try:
+            images.append(Image.open(image_path).convert("RGB"))
+            image_indices.append(i)
+        except Exception as e:
+            descriptions[i] = f"Error: {str(e)}"
+
+    if not images:
+        return descriptions
 
-        # Format the prompt
-        prompt = processor.apply_chat_template(messages, add_generation_prompt=True)
+    try:
+        batch_descriptions = generate_descriptions(images, max_tokens)
+        for i, description in zip(image_indices, batch_descriptions):
+            descriptions[i] = description
 
-        # Process inputs
-        inputs = processor(
-            text=prompt,
-            images=[image],
-            return_tensors="pt"
-        ).to(device)
+    except Exception as e:
+        for i in image_indices:
+            descriptions[i] = f"Error: {str(e)}"
+
+    return descriptions
+
+
+async def batch_worker(queue: asyncio.Queue):
+    """Drain the request queue, describing waiting requests in batches."""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+
+        # Collect more requests until the batch is full or the wait expires
+        deadline = loop.time() + MAX_BATCH_WAIT
+        while len(batch) < MAX_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
 
-        # Generate description
-        with torch.no_grad():
-            outputs = model.generate(
-                **inputs,
-                max_new_tokens=max_tokens,
-                do_sample=False,
-            )
+        # Run the model off the event loop so new requests keep queueing
+        image_paths = [image_path for image_path, _ in batch]
+        try:
+            descriptions = await asyncio.to_thread(describe_batch, image_paths)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            continue
 
-        # Decode output
-        description = processor.decode(outputs[0], skip_special_tokens=True)
+        for (_, future), description in zip(batch, descriptions):
+            if not future.done():
+                future.set_result(description)
 
-        # Extract just the response (remove prompt)
-        if "Assistant:" in description:
-            description = description.split("Assistant:")[-1].strip()
-        elif "\n\n" in description:
-            description = description.split("\n\n")[-1].strip()
 
-        return description
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.queue = asyncio.Queue()
+    worker = asyncio.create_task(batch_worker(app.state.queue))
+    yield
+    worker.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.post("/describe")
+async def describe(request: Request):
+    try:
+        data = await request.json()
+
+        image_path = data.get('image_path')
+        if not image_path or not Path(image_path).exists():
+            return JSONResponse({"error": "Invalid image path"}, status_code=400)
+
+        # Queue for the batch worker and wait for this request's result
+        future = asyncio.get_running_loop().create_future()
+        await request.app.state.queue.put((image_path, future))
+        description = await future
+
+        return {"description": description}
 
     except Exception as e:
-        return f"Error: {str(e)}"
+        return JSONResponse({"error": str(e)}, status_code=500)
 
-class SmolVLMHandler(BaseHTTPRequestHandler):
-    def log_message(self, format, *args):
-        # Suppress default logging
-        pass
 
-    def do_POST(self):
-        if self.path == '/describe':
-            try:
-                # Read request body
-                content_length = int(self.headers['Content-Length'])
-                body = self.rfile.read(content_length)
-                data = json.loads(body.decode('utf-8'))
-
-                image_path = data.get('image_path')
-                if not image_path or not Path(image_path).exists():
-                    self.send_response(400)
-                    self.send_header('Content-Type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({"error": "Invalid image path"}).encode())
-                    return
-
-                # Generate description
-                description = describe_image(image_path)
-
-                # Send response
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"description": description}).encode())
-
-            except Exception as e:
-                self.send_response(500)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": str(e)}).encode())
-        else:
-            self.send_response(404)
-            self.end_headers()
-
-    def do_GET(self):
-        if self.path == '/health':
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"status": "ready", "device": device}).encode())
-        else:
-            self.send_response(404)
-            self.end_headers()
+@app.get("/health")
+async def health():
+    return {"status": "ready", "device": device}
+
 
 def main():
     port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
 
-    server = HTTPServer(('localhost', port), SmolVLMHandler)
+    # Warm up kernels and allocator pools before /health reports ready
+    print("Warming up model...", file=sys.stderr)
+    generate_descriptions([Image.new("RGB", (384, 384))], max_tokens=8)
+
     print(f"SmolVLM2 server listening on http://localhost:{port}", file=sys.stderr)
     print(f"Ready to process images!", file=sys.stderr)
 
-    try:
-        server.serve_forever()
-    except KeyboardInterrupt:
-        print("\nShutting down server...", file=sys.stderr)
-        server.shutdown()
+    # A single worker: the model is GPU-bound and must not be duplicated.
+    # uvloop/httptools are picked up automatically when installed.
+    uvicorn.run(app, host="localhost", port=port, workers=1, log_level="warning")
+    print("\nShutting down server...", file=sys.stderr)
 
 if __name__ == "__main__":
     main()